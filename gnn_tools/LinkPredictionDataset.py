@@ -4,10 +4,10 @@
 # @Last Modified by:   Sadamori Kojaku
 # @Last Modified time: 2023-08-01 13:53:26
 import numpy as np
-import pandas as pd
 from scipy import sparse
 from tqdm import tqdm
 from scipy.sparse import csgraph
+from numba import njit, prange
 from gnn_tools.node_samplers import (
     ConfigModelNodeSampler,
     ErdosRenyiNodeSampler,
@@ -32,6 +32,7 @@ class LinkPredictionDataset:
     >> model = LinkPredictionDataset(testEdgeFraction=0.5, negative_edge_sampler="degreeBiased")
     >> model.fit(net)
     >> train_net, target_edge_table = model.transform()
+    >> target_edge_table = pd.DataFrame(target_edge_table)
     """
 
     def __init__(
@@ -75,13 +76,17 @@ class LinkPredictionDataset:
 
         train_src, train_trg = self.splitter.train_edges_
 
-        # Ensure that the network is undirected and unweighted
+        # Ensure that the network is undirected and unweighted. The data is kept
+        # int64 so that products such as train_net @ train_net do not overflow.
+        rows = np.concatenate([train_src, train_trg])
+        cols = np.concatenate([train_trg, train_src])
         self.train_net = sparse.csr_matrix(
-            (np.ones_like(train_src), (train_src, train_trg)),
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
             shape=(self.n_nodes, self.n_nodes),
         )
-        self.train_net = sparse.csr_matrix(self.train_net + self.train_net.T)
-        self.train_net.data = self.train_net.data * 0 + 1
+        del rows, cols
+        self.train_net.sum_duplicates()
+        self.train_net.data[:] = 1
 
         # Sampling negative edges
         self.sampler.fit(self.train_net)
@@ -96,15 +101,17 @@ class LinkPredictionDataset:
             negative_edge_sampler=negative_edge_sampler, **negative_edge_sampler_params
         )
 
-        self.target_edge_table = pd.DataFrame(
-            {
-                "src": np.concatenate([test_src, neg_src]),
-                "trg": np.concatenate([test_trg, neg_trg]),
-                "isPositiveEdge": np.concatenate(
-                    [np.ones_like(test_src), np.zeros_like(neg_trg)]
-                ),
-            }
-        )
+        # Plain dict of arrays. Wrap in pd.DataFrame at the call site if needed.
+        self.target_edge_table = {
+            "src": np.concatenate([test_src, neg_src]),
+            "trg": np.concatenate([test_trg, neg_trg]),
+            "isPositiveEdge": np.concatenate(
+                [
+                    np.ones(len(test_src), dtype=np.int8),
+                    np.zeros(len(neg_trg), dtype=np.int8),
+                ]
+            ),
+        }
         return self.train_net, self.target_edge_table
 
     def get_positive_edges(self):
@@ -113,11 +120,15 @@ class LinkPredictionDataset:
     def get_negative_edges(self, negative_edge_sampler=None, **params):
 
         if self.all_negatives:
-            # We evaluate the all positives and all negatives
-            neg_src, neg_trg = np.triu_indices(self.n_nodes, k=1)
-            y = np.array(self.net[(neg_src, neg_trg)]).reshape(-1)
-            s = y == 0
-            neg_src, neg_trg, y = neg_src[s], neg_trg[s], y[s]
+            # We evaluate the all positives and all negatives.
+            # Enumerate the non-edges row by row from the CSR pattern rather
+            # than materializing all n(n-1)/2 node pairs.
+            net = sparse.csr_matrix(self.net, copy=True)
+            net.sum_duplicates()
+            net.eliminate_zeros()
+            neg_src, neg_trg = _csr_triu_non_edges(
+                net.indptr, net.indices, self.n_nodes
+            )
             return neg_src, neg_trg
 
         if negative_edge_sampler is None:
@@ -132,14 +143,14 @@ class LinkPredictionDataset:
 
         test_src, test_trg = self.splitter.test_edges_
         n_test_edges = int(len(test_src))
-        neg_src, neg_trg = [], []
-        for _ in range(self.negatives_per_positive):
-            _neg_src, _neg_trg = negative_edge_sampler.sampling(
-                size=n_test_edges, test_edges=(test_src, test_trg)
-            )
-            neg_src.append(_neg_src)
-            neg_trg.append(_neg_trg)
-        neg_src, neg_trg = np.concatenate(neg_src), np.concatenate(neg_trg)
+
+        # Sample the negatives for all rounds in one call to share the lookup setup.
+        # Negative edges are deduplicated within each round, not across rounds.
+        neg_src, neg_trg = negative_edge_sampler.sampling(
+            size=n_test_edges * self.negatives_per_positive,
+            test_edges=(test_src, test_trg),
+            n_rounds=self.negatives_per_positive,
+        )
         return neg_src, neg_trg
 
 
@@ -157,15 +168,40 @@ class TrainTestEdgeSplitter:
 
         Train network should have a one weakly connected component.
         """
-        r, c, _ = sparse.find(A)
-        edges = np.unique(pairing(r, c))
-
-        MST = csgraph.minimum_spanning_tree(A + A.T)
-        r, c, _ = sparse.find(MST)
-        mst_edges = np.unique(pairing(r, c))
-        remained_edge_set = np.array(
-            list(set(list(edges)).difference(set(list(mst_edges))))
-        )
+        self.n = A.shape[0]
+        node_dtype = _node_dtype(self.n)
+        key_dtype, shift = _pair_spec(self.n)
+
+        # Symmetrize only if needed. `maximum` avoids doubling the edge weights
+        A = sparse.csr_matrix(A)
+        if (A != A.T).nnz == 0:
+            Asym = A
+        else:
+            Asym = A.maximum(A.T)
+
+        # Drop explicit zeros, which are not edges
+        Asym = sparse.csr_matrix(Asym)
+        if (not Asym.has_canonical_format) or np.any(Asym.data == 0):
+            Asym = Asym.copy()
+            Asym.sum_duplicates()
+            Asym.eliminate_zeros()
+
+        # The network is symmetric, so the upper triangle holds every edge
+        r, c = _csr_triu(Asym.indptr, Asym.indices)
+        edges = np.unique(pairing(r, c, key_dtype=key_dtype, shift=shift))
+        del r, c
+
+        MST = _spanning_forest(Asym)
+        del Asym
+        # Tree edges may be stored in either triangle, so read all CSR entries
+        MST = sparse.csr_matrix(MST)
+        r = np.repeat(np.arange(MST.shape[0]), np.diff(MST.indptr))
+        c = MST.indices
+        del MST
+        mst_edges = np.unique(pairing(r, c, key_dtype=key_dtype, shift=shift))
+        del r, c
+        remained_edge_set = np.setdiff1d(edges, mst_edges, assume_unique=True)
+        del mst_edges
         n_edge_removal = int(len(edges) * self.fraction)
         if len(remained_edge_set) < n_edge_removal:
             raise Exception(
@@ -175,14 +211,14 @@ class TrainTestEdgeSplitter:
         test_edge_set = np.random.choice(
             remained_edge_set, n_edge_removal, replace=False
         )
+        del remained_edge_set
 
-        train_edge_set = np.array(
-            list(set(list(edges)).difference(set(list(test_edge_set))))
-        )
+        test_edge_set = np.sort(test_edge_set)
+        train_edge_set = np.setdiff1d(edges, test_edge_set, assume_unique=True)
+        del edges
 
-        self.test_edges_ = depairing(test_edge_set)
-        self.train_edges_ = depairing(train_edge_set)
-        self.n = A.shape[0]
+        self.test_edges_ = depairing(test_edge_set, dtype=node_dtype, shift=shift)
+        self.train_edges_ = depairing(train_edge_set, dtype=node_dtype, shift=shift)
 
     def transform(self):
         return self.train_edges_, self.test_edges_
@@ -203,24 +239,36 @@ class NegativeEdgeSampler:
             "randomWalk": False,
         }[negative_edge_sampler]
         self.duplicated_negative_edges = duplicated_negative_edges
+        self._rng = np.random.default_rng()
 
     def fit(self, net):
+        # Positive edges are looked up directly in the CSR rows, which must be
+        # sorted and free of duplicates and explicit zeros
+        net = sparse.csr_matrix(net)
+        if (not net.has_canonical_format) or np.any(net.data == 0):
+            net = net.copy()
+            net.sum_duplicates()
+            net.eliminate_zeros()
         self.net = net
         self.n_nodes = net.shape[0]
-        src, trg, _ = sparse.find(sparse.triu(net))
-        self.edge_indices = pairing(src, trg)
+        self._pair_dtype, self._pair_shift = _pair_spec(self.n_nodes)
         self.sampler.fit(net)
 
-    def sampling(self, size=None, source_nodes=None, test_edges=None):
+    def sampling(self, size=None, source_nodes=None, test_edges=None, n_rounds=1):
         """
         Generates a dataset for link prediction by sampling positive and negative edges using the specified negative edge sampler.
 
+        If the sampler cannot fill all slots within the iteration limit, the remaining slots are filled with uniformly random non-edges instead of pairs from the configured sampler. On nearly complete networks, they are chosen from the exact list of non-edges.
+
         :param size: Number of edges to sample. Defaults to None.
         :type size: int, optional
         :param source_nodes: List of source nodes to condition negative edge sampling on. Defaults to None.
         :type source_nodes: list, optional
-        :return: Tuple of node indices for positive edges (pos_edges) and negative edges (neg_edges)
+        :param n_rounds: Number of equal-sized rounds the negative edges are split into. With `duplicated_negative_edges=False`, negative edges are unique within each round but may repeat across rounds. Defaults to 1.
+        :type n_rounds: int, optional
+        :return: Tuple of node indices for positive edges (pos_edges) and negative edges (neg_edges), ordered by round
         :rtype: tuple
+        :raises Exception: If the network does not have enough non-edges to sample `size` negative edges
         """
 
         if (self.conditionedOnSource) & (source_nodes is None):
@@ -236,74 +284,347 @@ class NegativeEdgeSampler:
             size = len(source_nodes)
         else:
             source_nodes = self.sampler.sampling_source_nodes(size=size)
-
-        sampled_neg_edge_indices = []
+        source_nodes = source_nodes.astype(_node_dtype(self.n_nodes))
+        source_rounds = np.arange(size, dtype=np.int64) * n_rounds // max(size, 1)
+
+        # Each source node yields at most one negative edge, so `size` slots suffice.
+        # The already-sampled pairs are kept sorted within each round, with
+        # sampled_ptr[r]:sampled_ptr[r + 1] being the segment of round r.
+        sampled_neg_edge_indices = np.empty(size, dtype=self._pair_dtype)
+        sampled_rounds = np.empty(size, dtype=np.int64)
+        sampled_sorted = np.empty(0, dtype=self._pair_dtype)
+        sampled_ptr = np.zeros(n_rounds + 1, dtype=np.int64)
         n_sampled = 0
 
         # Repeat until n_test_edges number of negative edges are sampled.
         n_iters = 0
         max_iters = 30
+        max_oversample = 16
         if test_edges is not None:
-            test_edges = pairing(*test_edges)
-
-        while (n_sampled < size) and (n_iters < max_iters):
-            # Sample negative edges based on SBM sampler
-            _neg_src, _neg_trg = self.sampler.sampling(center_nodes=source_nodes)
+            test_edges = np.sort(self._pairing(*test_edges))
+        else:
+            test_edges = np.empty(0, dtype=self._pair_dtype)
+
+        while (n_sampled < size) and (n_iters < 2 * max_iters):
+            # Sources rejected in earlier iterations tend to be saturated, so we
+            # draw several candidate edges per source in one sampler call,
+            # doubling the number of candidates in every iteration.
+            oversample = min(2 ** (n_iters % max_iters), max_oversample)
+
+            if n_iters < max_iters:
+                # Sample negative edges based on SBM sampler
+                _neg_src, _neg_trg = self.sampler.sampling(
+                    center_nodes=np.repeat(source_nodes, oversample)
+                )
+            else:
+                # The sampler stalled. Fill the remaining slots with uniformly
+                # random node pairs that pass the same filter.
+                _neg_src, _neg_trg = self._rng.integers(
+                    0, self.n_nodes, size=(2, len(source_nodes) * oversample)
+                )
+            _rounds = np.repeat(source_rounds, oversample)
 
             # To edge indices for computation ease
-            _neg_edge_indices = pairing(_neg_src, _neg_trg)
+            _neg_edge_indices = self._pairing(_neg_src, _neg_trg)
 
             #
             # The sampled node pairs contain self loops, positive edges, and duplicates, which we remove here
             #
-            reject = np.full(len(_neg_src), False)
-
-            # Remove _neg_edge_indices duplicated in self.edge_indices
-            positivePairs = np.isin(_neg_edge_indices, self.edge_indices)
-            reject[positivePairs] = True
-
-            # Remove test edges from negative edges
-            if test_edges is not None:
-                positivePairs = np.isin(_neg_edge_indices, test_edges)
-                reject[positivePairs] = True
-
-            # Keep non-self-loops
-            reject[_neg_src == _neg_trg] = True
+            reject = self._reject(
+                _neg_edge_indices,
+                _neg_src,
+                _neg_trg,
+                _rounds,
+                test_edges,
+                sampled_sorted,
+                sampled_ptr,
+            )
 
-            # Keep only the unique pairs
-            if self.duplicated_negative_edges == False:
-                isUnique = np.full(len(_neg_src), False)
-                isUnique[np.unique(_neg_edge_indices, return_index=True)[1]] = True
-                reject[~isUnique] = True
+            # Take the first surviving candidate of each source node
+            accept = ~reject.reshape(-1, oversample)
+            has_accept = np.any(accept, axis=1)
+            chosen = np.argmax(accept, axis=1)
+            chosen += np.arange(len(source_nodes)) * oversample
+            chosen = chosen[has_accept]
 
-                # Keep the pairs that have not been sampled
-                existingPairs = np.isin(_neg_edge_indices, sampled_neg_edge_indices)
-                reject[existingPairs] = True
             #
             # Add the survived negative edges to the list
             #
-            sampled_neg_edge_indices += _neg_edge_indices[~reject].tolist()
+            n_new = len(chosen)
+            sampled_neg_edge_indices[n_sampled : n_sampled + n_new] = _neg_edge_indices[
+                chosen
+            ]
+            sampled_rounds[n_sampled : n_sampled + n_new] = _rounds[chosen]
+            if self.duplicated_negative_edges == False:
+                sampled_sorted, sampled_ptr = _merge_sorted(
+                    sampled_sorted,
+                    sampled_ptr,
+                    _neg_edge_indices[chosen],
+                    _rounds[chosen],
+                )
 
             # Keep the rejected source nodes for resampling
-            source_nodes = source_nodes[reject]
-
-            # Update the progress bar
-            diff = len(sampled_neg_edge_indices) - n_sampled
-            n_sampled += diff
+            source_nodes = source_nodes[~has_accept]
+            source_rounds = source_rounds[~has_accept]
 
+            n_sampled += n_new
             n_iters += 1
 
-        neg_src, neg_trg = depairing(np.array(sampled_neg_edge_indices))
-        if len(neg_src) < size:
-            ids = np.random.choice(len(neg_src), size=size - len(neg_src), replace=True)
-            neg_src = np.concatenate([neg_src, neg_src[ids]])
-            neg_trg = np.concatenate([neg_trg, neg_trg[ids]])
+        #
+        # The random draws stalled, e.g., on a nearly complete network. Choose
+        # the rest of each round from the exact list of the remaining node pairs.
+        #
+        if n_sampled < size:
+            _neg_src, _neg_trg = _csr_triu_non_edges(
+                self.net.indptr, self.net.indices, self.n_nodes
+            )
+            _neg_edge_indices = self._pairing(_neg_src, _neg_trg)
+            _neg_edge_indices = _neg_edge_indices[
+                ~_isin_sorted(_neg_edge_indices, test_edges)
+            ]
+
+            replace = self.duplicated_negative_edges
+            for r, deficit in enumerate(np.bincount(source_rounds, minlength=n_rounds)):
+                if deficit == 0:
+                    continue
+                candidates = _neg_edge_indices[
+                    ~_isin_sorted(
+                        _neg_edge_indices,
+                        sampled_sorted[sampled_ptr[r] : sampled_ptr[r + 1]],
+                    )
+                ]
+                if (len(candidates) == 0) or (
+                    (not replace) and (len(candidates) < deficit)
+                ):
+                    raise Exception(
+                        "Cannot sample enough negative edges. Decrease the `negatives_per_positive` parameter"
+                    )
+                sampled_neg_edge_indices[n_sampled : n_sampled + deficit] = (
+                    self._rng.choice(candidates, size=deficit, replace=replace)
+                )
+                sampled_rounds[n_sampled : n_sampled + deficit] = r
+                n_sampled += deficit
+
+        # Order the negative edges by round
+        order = np.argsort(sampled_rounds, kind="stable")
+        neg_src, neg_trg = depairing(
+            sampled_neg_edge_indices[order],
+            dtype=_node_dtype(self.n_nodes),
+            shift=self._pair_shift,
+        )
         return neg_src, neg_trg
 
+    def _pairing(self, r, c):
+        return pairing(r, c, key_dtype=self._pair_dtype, shift=self._pair_shift)
 
-def pairing(r, c):
-    return np.minimum(r, c) + 1j * np.maximum(r, c)
+    def _reject(
+        self,
+        neg_edge_indices,
+        neg_src,
+        neg_trg,
+        rounds,
+        test_edges,
+        sampled_sorted,
+        sampled_ptr,
+    ):
+        if self.duplicated_negative_edges == False:
+            isUnique = _first_occurrence(neg_edge_indices, rounds)
+        else:
+            isUnique = np.ones(len(neg_edge_indices), dtype=bool)
+
+        return _filter_negatives(
+            neg_edge_indices,
+            neg_src,
+            neg_trg,
+            rounds,
+            isUnique,
+            self.net.indptr,
+            self.net.indices,
+            test_edges,
+            sampled_sorted,
+            sampled_ptr,
+        )
 
 
-def depairing(v):
-    return np.real(v).astype(int), np.imag(v).astype(int)
+def pairing(r, c, key_dtype=np.int64, shift=32):
+    # Pack the unordered pair (min, max) into a single integer key
+    a = np.minimum(r, c).astype(key_dtype)
+    b = np.maximum(r, c).astype(key_dtype)
+    return (a << shift) | b
+
+
+def depairing(v, dtype=np.int64, shift=32):
+    v = np.asarray(v)
+    return (v >> shift).astype(dtype), (v & ((1 << shift) - 1)).astype(dtype)
+
+
+def _pair_spec(n_nodes):
+    # Narrowest key type and shift for pairing. Small graphs fit both node IDs
+    # in 16 bits each, i.e., a uint32 key.
+    if n_nodes < 2**16:
+        return np.uint32, 16
+    return np.int64, 32
+
+
+def _spanning_forest(A):
+    # Any spanning tree preserves the connectedness, so we use BFS trees, which
+    # are cheaper than the minimum spanning tree. Disconnected components are
+    # covered by attaching a virtual root node to one node of each component.
+    n = A.shape[0]
+    n_components, labels = csgraph.connected_components(A, directed=False)
+    if n_components == 1:
+        return csgraph.breadth_first_tree(A, 0, directed=False)
+
+    roots = np.unique(labels, return_index=True)[1]
+    A = sparse.csr_matrix(A, copy=True)
+    A.resize((n + 1, n + 1))
+    A = A + sparse.csr_matrix(
+        (np.ones(n_components), (np.full(n_components, n), roots)),
+        shape=(n + 1, n + 1),
+    )
+    return csgraph.breadth_first_tree(A, n, directed=False)[:n, :n]
+
+
+def _node_dtype(n_nodes):
+    # Narrowest integer type that can hold the node IDs
+    return np.int32 if n_nodes < 2**31 else np.int64
+
+
+@njit(nogil=True)
+def _csr_triu(indptr, indices):
+    # Entries (i, j) with i <= j of a CSR matrix, without a COO/triu copy
+    n_rows = len(indptr) - 1
+    n_upper = 0
+    for i in range(n_rows):
+        for k in range(indptr[i], indptr[i + 1]):
+            if indices[k] >= i:
+                n_upper += 1
+
+    src = np.empty(n_upper, dtype=indices.dtype)
+    trg = np.empty(n_upper, dtype=indices.dtype)
+    pos = 0
+    for i in range(n_rows):
+        for k in range(indptr[i], indptr[i + 1]):
+            if indices[k] >= i:
+                src[pos] = i
+                trg[pos] = indices[k]
+                pos += 1
+    return src, trg
+
+
+@njit(nogil=True, parallel=True)
+def _csr_triu_non_edges(indptr, indices, n_nodes):
+    # Node pairs (i, j) with i < j that are not stored in the CSR matrix.
+    # Assumes sorted indices without duplicates. Rows are filled in parallel.
+    counts = np.zeros(n_nodes, dtype=np.int64)
+    for i in prange(n_nodes):
+        nbrs = indices[indptr[i] : indptr[i + 1]]
+        n_upper = len(nbrs) - np.searchsorted(nbrs, i, side="right")
+        counts[i] = n_nodes - i - 1 - n_upper
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    src = np.empty(offsets[n_nodes], dtype=indices.dtype)
+    trg = np.empty(offsets[n_nodes], dtype=indices.dtype)
+    for i in prange(n_nodes):
+        nbrs = indices[indptr[i] : indptr[i + 1]]
+        k = np.searchsorted(nbrs, i, side="right")
+        pos = offsets[i]
+        for j in range(i + 1, n_nodes):
+            if (k < len(nbrs)) and (nbrs[k] == j):
+                k += 1
+                continue
+            src[pos] = i
+            trg[pos] = j
+            pos += 1
+    return src, trg
+
+
+@njit(nogil=True)
+def _contains_sorted(sorted_arr, x):
+    idx = np.searchsorted(sorted_arr, x)
+    return (idx < len(sorted_arr)) and (sorted_arr[idx] == x)
+
+
+def _isin_sorted(x, sorted_arr):
+    # Membership test against a pre-sorted reference array
+    if len(sorted_arr) == 0:
+        return np.zeros(len(x), dtype=bool)
+    idx = np.searchsorted(sorted_arr, x)
+    idx[idx == len(sorted_arr)] = len(sorted_arr) - 1
+    return sorted_arr[idx] == x
+
+
+@njit(nogil=True)
+def _segmented_searchsorted(sorted_arr, ptr, values, groups):
+    # Insertion positions of values into the sorted segment of their group
+    pos = np.empty(len(values), dtype=np.int64)
+    for i in range(len(values)):
+        g = groups[i]
+        seg = sorted_arr[ptr[g] : ptr[g + 1]]
+        pos[i] = ptr[g] + np.searchsorted(seg, values[i])
+    return pos
+
+
+def _merge_sorted(sorted_arr, ptr, new, new_groups):
+    # Insert `new` values, none of which are in the segment of their group,
+    # keeping every segment sorted
+    order = np.lexsort((new, new_groups))
+    new, new_groups = new[order], new_groups[order]
+    pos = _segmented_searchsorted(sorted_arr, ptr, new, new_groups)
+    ptr = ptr.copy()
+    ptr[1:] += np.cumsum(np.bincount(new_groups, minlength=len(ptr) - 1))
+    return np.insert(sorted_arr, pos, new), ptr
+
+
+def _first_occurrence(v, groups):
+    # Mark the first occurrence of each value within its group via a stable
+    # sort, which is cheaper than np.unique(..., return_index=True)
+    is_first = np.zeros(len(v), dtype=bool)
+    if len(v) == 0:
+        return is_first
+    order = np.lexsort((v, groups))
+    sorted_v, sorted_groups = v[order], groups[order]
+    first = np.empty(len(v), dtype=bool)
+    first[0] = True
+    first[1:] = (sorted_v[1:] != sorted_v[:-1]) | (
+        sorted_groups[1:] != sorted_groups[:-1]
+    )
+    is_first[order[first]] = True
+    return is_first
+
+
+@njit(nogil=True, parallel=True)
+def _filter_negatives(
+    neg_idx,
+    neg_src,
+    neg_trg,
+    rounds,
+    is_unique,
+    indptr,
+    indices,
+    sorted_test,
+    sorted_sampled,
+    sampled_ptr,
+):
+    # Reject self-loops, positive (train/test) edges, in-batch duplicates and
+    # pairs already sampled in the same round in a single pass. Training edges
+    # are found by a binary search in the CSR row of the smaller node ID, which
+    # has the same semantics as a lookup in the upper triangle of the network.
+    # The pairs sampled in round g are sorted_sampled[sampled_ptr[g]:sampled_ptr[g + 1]].
+    n = len(neg_idx)
+    reject = np.zeros(n, dtype=np.bool_)
+    for i in prange(n):
+        v = neg_idx[i]
+        r, c = min(neg_src[i], neg_trg[i]), max(neg_src[i], neg_trg[i])
+        if (r == c) or (not is_unique[i]):
+            reject[i] = True
+        elif _contains_sorted(indices[indptr[r] : indptr[r + 1]], c):
+            reject[i] = True
+        elif _contains_sorted(sorted_test, v):
+            reject[i] = True
+        elif _contains_sorted(
+            sorted_sampled[sampled_ptr[rounds[i]] : sampled_ptr[rounds[i] + 1]], v
+        ):
+            reject[i] = True
+    return reject
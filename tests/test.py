@@ -2,6 +2,7 @@ import unittest
 import gnn_tools
 from scipy import sparse
 import numpy as np
+import pandas as pd
 from sklearn.metrics import roc_auc_score
 
 
@@ -57,6 +58,7 @@ class TestCommunityDetection(unittest.TestCase):
 
         dataset.fit(self.A)
         train_net, test_edge_table = dataset.transform()
+        test_edge_table = pd.DataFrame(test_edge_table)
 
         # Test
         positive_edge_table = test_edge_table[test_edge_table["isPositiveEdge"] == 1]
@@ -87,3 +89,138 @@ class TestCommunityDetection(unittest.TestCase):
 
         # test_net and train_net must be disjoint
         assert np.all((test_net.multiply(train_net)).data == 0)
+
+    def test_all_negatives(self):
+        from gnn_tools.LinkPredictionDataset import _csr_triu_non_edges
+
+        n_nodes = self.A.shape[0]
+        net = sparse.csr_matrix(self.A)
+        net.sort_indices()
+        neg_src, neg_trg = _csr_triu_non_edges(net.indptr, net.indices, n_nodes)
+
+        src, trg = np.triu_indices(n_nodes, k=1)
+        s = np.array(net[(src, trg)]).reshape(-1) == 0
+        assert np.array_equal(neg_src, src[s])
+        assert np.array_equal(neg_trg, trg[s])
+
+        dataset = gnn_tools.LinkPredictionDataset(
+            testEdgeFraction=0.25, negative_edge_sampler="uniform", all_negatives=True
+        )
+        dataset.fit(self.A)
+        _, test_edge_table = dataset.transform()
+        isNegative = test_edge_table["isPositiveEdge"] == 0
+        assert np.array_equal(test_edge_table["src"][isNegative], src[s])
+        assert np.array_equal(test_edge_table["trg"][isNegative], trg[s])
+
+    def test_disconnected_train_test_split(self):
+        from scipy.sparse import csgraph
+
+        # Two disjoint components plus an isolated node
+        n_nodes = self.A.shape[0]
+        A = sparse.block_diag([self.A, self.A, sparse.csr_matrix((1, 1))])
+        A = sparse.csr_matrix(A)
+        n_components = csgraph.connected_components(A, directed=False)[0]
+        assert n_components == 3
+
+        splitter = gnn_tools.TrainTestEdgeSplitter(fraction=0.25)
+        splitter.fit(A)
+        train_src, train_trg = splitter.train_edges_
+        train_net = sparse.csr_matrix(
+            (np.ones(len(train_src)), (train_src, train_trg)),
+            shape=(2 * n_nodes + 1, 2 * n_nodes + 1),
+        )
+        assert csgraph.connected_components(train_net, directed=False)[0] == 3
+
+    def test_negative_edge_sampler_top_up(self):
+        # Complete graph without the edges of a cycle, which leaves exactly
+        # n_nodes non-edges to be sampled
+        n_nodes = 20
+        cycle_src = np.arange(n_nodes)
+        cycle_trg = (cycle_src + 1) % n_nodes
+        C = sparse.csr_matrix(
+            (np.ones(n_nodes), (cycle_src, cycle_trg)), shape=(n_nodes, n_nodes)
+        )
+        C = C + C.T
+        A = sparse.csr_matrix(np.ones((n_nodes, n_nodes)) - np.eye(n_nodes) - C)
+        A.eliminate_zeros()
+
+        sampler = gnn_tools.NegativeEdgeSampler(negative_edge_sampler="uniform")
+        sampler.fit(A)
+        neg_src, neg_trg = sampler.sampling(size=n_nodes)
+
+        neg_edges = set(zip(np.minimum(neg_src, neg_trg), np.maximum(neg_src, neg_trg)))
+        cycle_edges = set(
+            zip(np.minimum(cycle_src, cycle_trg), np.maximum(cycle_src, cycle_trg))
+        )
+        assert len(neg_src) == n_nodes
+        assert neg_edges == cycle_edges
+
+        with self.assertRaises(Exception):
+            sampler.sampling(size=n_nodes + 1)
+
+    def test_pairing(self):
+        from gnn_tools.LinkPredictionDataset import _pair_spec, pairing, depairing
+
+        for n_nodes, expected_dtype in [(2**16 - 1, np.uint32), (2**16, np.int64)]:
+            key_dtype, shift = _pair_spec(n_nodes)
+            assert key_dtype == expected_dtype
+
+            rng = np.random.default_rng(0)
+            r = np.concatenate(
+                [[0, n_nodes - 1, n_nodes - 1], rng.integers(0, n_nodes, 1000)]
+            )
+            c = np.concatenate(
+                [[n_nodes - 1, 0, n_nodes - 2], rng.integers(0, n_nodes, 1000)]
+            )
+            keys = pairing(r, c, key_dtype=key_dtype, shift=shift)
+            assert keys.dtype == expected_dtype
+
+            src, trg = depairing(keys, shift=shift)
+            assert np.array_equal(src, np.minimum(r, c))
+            assert np.array_equal(trg, np.maximum(r, c))
+
+            # Keys are ordered by (min, max)
+            order = np.argsort(keys, kind="stable")
+            expected_order = np.lexsort((np.maximum(r, c), np.minimum(r, c)))
+            assert np.array_equal(keys[order], keys[expected_order])
+
+    def test_negatives_per_positive(self):
+        # Negative edges are unique within each round, and sampling several
+        # rounds keeps the degree bias of a single round
+        deg = np.array((self.A > 0).sum(axis=1)).reshape(-1)
+
+        def sample(negatives_per_positive):
+            dataset = gnn_tools.LinkPredictionDataset(
+                testEdgeFraction=0.25,
+                negative_edge_sampler="degreeBiased",
+                negatives_per_positive=negatives_per_positive,
+            )
+            dataset.fit(self.A)
+            _, test_edge_table = dataset.transform()
+            isNegative = test_edge_table["isPositiveEdge"] == 0
+            return (
+                test_edge_table["src"][isNegative],
+                test_edge_table["trg"][isNegative],
+            )
+
+        n_rounds = 10
+        deg_prod_single, deg_prod_multi = [], []
+        for _ in range(10):
+            neg_src, neg_trg = sample(1)
+            deg_prod_single.append(np.mean(deg[neg_src] * deg[neg_trg]))
+        for _ in range(5):
+            neg_src, neg_trg = sample(n_rounds)
+            deg_prod_multi.append(np.mean(deg[neg_src] * deg[neg_trg]))
+
+            n_test_edges = len(neg_src) // n_rounds
+            for r in range(n_rounds):
+                s = slice(r * n_test_edges, (r + 1) * n_test_edges)
+                pairs = set(
+                    zip(
+                        np.minimum(neg_src[s], neg_trg[s]),
+                        np.maximum(neg_src[s], neg_trg[s]),
+                    )
+                )
+                assert len(pairs) == n_test_edges
+
+        assert np.mean(deg_prod_multi) > 0.8 * np.mean(deg_prod_single)